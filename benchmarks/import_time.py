@@ -0,0 +1,102 @@
+"""Cold-start import benchmark for the flow entry points.
+
+Each module is imported in a fresh interpreter so nothing is shared between
+runs. Importing prefect's decorators is timed the same way, interleaved with
+the module runs, and subtracted, leaving the overhead added by our own module. A module passes when that
+overhead stays within its budget and none of the heavy client libraries
+(simfin, google-cloud-bigquery, prefect_gcp, pandas) were imported.
+
+Usage:
+    python benchmarks/import_time.py [--runs 5]
+"""
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).parent.parent
+
+# What every flow module needs anyway; our overhead is measured on top of it
+BASELINE = "from prefect import flow, task"
+
+# Seconds allowed on top of the baseline (mostly building task/flow objects)
+TARGETS = {
+    "flows.extract": 0.2,
+    "flows.transform": 0.2,
+    "flows.load": 0.2,
+    "flows.orchestrate": 0.3,
+}
+
+HEAVY_MODULES = ["simfin", "google.cloud.bigquery", "prefect_gcp", "pandas"]
+
+PROBE = """
+import json, sys, time
+start = time.perf_counter()
+{statement}
+elapsed = time.perf_counter() - start
+heavy = [m for m in {heavy!r} if m in sys.modules]
+print(json.dumps({{"seconds": elapsed, "heavy": heavy}}))
+"""
+
+
+def time_import(statement: str) -> dict:
+    result = subprocess.run(
+        [sys.executable, "-c", PROBE.format(statement=statement, heavy=HEAVY_MODULES)],
+        cwd=PROJECT_ROOT,
+        capture_output=True,
+        text=True,
+        check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def measure(module: str, runs: int) -> dict:
+    # Baseline and module imports are interleaved so machine-wide noise
+    # affects both sides of each difference equally
+    totals, overheads = [], []
+    for _ in range(runs):
+        baseline = time_import(BASELINE)
+        result = time_import(f"import {module}")
+        totals.append(result["seconds"])
+        overheads.append(result["seconds"] - baseline["seconds"])
+    return {
+        "seconds": statistics.median(totals),
+        "overhead": max(statistics.median(overheads), 0.0),
+        "heavy": result["heavy"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    print(f"Baseline: {BASELINE}")
+    print("-" * 60)
+
+    failures = 0
+    for module, target in TARGETS.items():
+        try:
+            result = measure(module, args.runs)
+        except subprocess.CalledProcessError as e:
+            print(f"✗ {module}: import failed\n{e.stderr}")
+            failures += 1
+            continue
+        overhead = result["overhead"]
+        ok = overhead <= target and not result["heavy"]
+        failures += not ok
+        mark = "✓" if ok else "✗"
+        print(f"{mark} {module}: {result['seconds'] * 1000:.0f} ms "
+              f"(+{overhead * 1000:.0f} ms over baseline, target +{target * 1000:.0f} ms)")
+        if result["heavy"]:
+            print(f"    heavy modules imported: {', '.join(result['heavy'])}")
+
+    print("-" * 60)
+    print(f"SUMMARY: {len(TARGETS) - failures}/{len(TARGETS)} modules within target")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
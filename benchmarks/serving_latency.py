@@ -0,0 +1,146 @@
+"""Latency benchmark for serving.prices.PriceStore.
+
+Writes a synthetic dataset in the layout the Spark job produces (one
+``year=YYYY/month=M/*.parquet`` file per month, sorted by Ticker and Date,
+with small row groups) to a temporary directory, then times index build,
+cold and warm single-ticker lookups and batch lookups. Pass --data to
+benchmark real transform output instead. A run passes when the median cold
+"last N days" lookup stays under TARGET_COLD_MS and warm lookups under
+TARGET_WARM_MS.
+
+Usage:
+    python benchmarks/serving_latency.py [--tickers 2000] [--years 5] [--data DIR]
+"""
+import argparse
+import datetime as dt
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+from serving.prices import PriceStore
+from spark.schema_contract import PRICES_SCHEMA
+
+TARGET_COLD_MS = 10.0
+TARGET_WARM_MS = 1.0
+ROW_GROUP_SIZE = 8192
+
+# Arrow types matching what the Spark job writes for each contract type
+ARROW_TYPES = {
+    "STRING": pa.string(),
+    "DATE": pa.date32(),
+    "FLOAT": pa.float64(),
+    "INTEGER": pa.int64(),
+}
+
+
+def ticker_names(count: int):
+    return [f"T{i:05d}" for i in range(count)]
+
+
+def write_dataset(root: Path, tickers, years: int):
+    end = dt.date(2025, 12, 31)
+    start = dt.date(end.year - years + 1, 1, 1)
+    days = np.arange(np.datetime64(start), np.datetime64(end) + 1)
+    days = days[np.is_busday(days)]
+    rng = np.random.default_rng(0)
+    for year in range(start.year, end.year + 1):
+        for month in range(1, 13):
+            month_days = days[(days.astype("datetime64[M]") == np.datetime64(f"{year}-{month:02d}"))]
+            if not len(month_days):
+                continue
+            n = len(month_days)
+            rows = len(tickers) * n
+            close = rng.uniform(5, 500, size=rows)
+            values = {
+                "Ticker": np.repeat(tickers, n),
+                "Date": np.tile(month_days, len(tickers)),
+                "Open": close * 0.99,
+                "High": close * 1.01,
+                "Low": close * 0.98,
+                "Close": close,
+                "Adj_Close": close,
+                "Volume": rng.integers(1_000, 10_000_000, size=rows),
+                "SMA_20": close,
+                "Daily_Return": rng.normal(0, 0.02, size=rows),
+            }
+            # Columns, order and types follow the contract the Spark job writes
+            table = pa.table({c.name: pa.array(values[c.name], ARROW_TYPES[c.type]) for c in PRICES_SCHEMA})
+            out = root / f"year={year}" / f"month={month}"
+            out.mkdir(parents=True, exist_ok=True)
+            pq.write_table(table, out / "part-00000.parquet", row_group_size=ROW_GROUP_SIZE)
+
+
+def timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    fn(*args, **kwargs)
+    return (time.perf_counter() - start) * 1000
+
+
+def report(label: str, samples):
+    samples = sorted(samples)
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    p50 = statistics.median(samples)
+    print(f"  {label:<34} p50 {p50:8.2f} ms   p95 {p95:8.2f} ms")
+    return p50
+
+
+def run(root: Path, tickers, lookups: int, days: int, batch: int):
+    start = time.perf_counter()
+    with PriceStore(root) as store:
+        print(f"  {'index build':<34} {(time.perf_counter() - start) * 1000:8.2f} ms "
+              f"({len(store.index)} row groups)")
+        rng = random.Random(0)
+        sample = rng.sample(tickers, min(lookups, len(tickers)))
+        cold = report(f"cold last_n_days({days})", [timed(store.last_n_days, t, days) for t in sample])
+        warm = report(f"warm last_n_days({days})", [timed(store.last_n_days, t, days) for t in sample])
+
+    with PriceStore(root) as store:
+        report("cold history", [timed(store.history, t) for t in sample[:20]])
+        report("warm history", [timed(store.history, t) for t in sample[:20]])
+
+    with PriceStore(root) as store:
+        batches = [rng.sample(tickers, batch) for _ in range(10)]
+        report(f"cold get_many({batch}, days={days})", [timed(store.get_many, b, days) for b in batches])
+    return cold, warm
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--tickers", type=int, default=2000)
+    parser.add_argument("--years", type=int, default=5)
+    parser.add_argument("--lookups", type=int, default=200)
+    parser.add_argument("--days", type=int, default=30)
+    parser.add_argument("--batch", type=int, default=50)
+    parser.add_argument("--data", type=Path, help="Existing transformed/prices directory to benchmark")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.data:
+            root = args.data
+            tickers = sorted(pq.read_table(root, columns=["Ticker"])["Ticker"].unique().to_pylist())
+        else:
+            root = Path(tmp)
+            tickers = ticker_names(args.tickers)
+            print(f"Writing {args.tickers} tickers x {args.years} years to {root}...")
+            write_dataset(root, tickers, args.years)
+        print("=" * 60)
+        cold, warm = run(root, tickers, args.lookups, args.days, args.batch)
+
+    print("=" * 60)
+    ok = cold <= TARGET_COLD_MS and warm <= TARGET_WARM_MS
+    mark = "✓" if ok else "✗"
+    print(f"{mark} cold p50 {cold:.2f} ms (target {TARGET_COLD_MS} ms), "
+          f"warm p50 {warm:.3f} ms (target {TARGET_WARM_MS} ms)")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
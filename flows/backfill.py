@@ -0,0 +1,320 @@
+"""Rebuild transformed history in independent, retryable slices.
+
+A backfill splits [start, end) into year or month slices aligned to the
+output partitions and runs each slice as its own Spark job, a few at a time,
+writing to a staging prefix in the bucket. Per-slice status is kept in a
+local state file, so rerunning the same backfill only runs slices that have
+not succeeded. Once a run has been swapped its state file is archived, and
+running the same range again (say after a formula change) starts a new run. Once every slice has succeeded, the rebuilt partitions are
+copied into transformed/ and the stats sidecar is updated. The copy is not
+atomic, so it runs under the transformed/ lock (utils/swap_lock.py), which
+the load flow also holds while it reads transformed/.
+
+Usage:
+    python flows/backfill.py prices 2015-01-01 2021-01-01 --slice month --concurrency 2
+"""
+import argparse
+import json
+import subprocess
+import uuid
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import date, datetime, timezone
+from pathlib import Path
+from threading import Lock
+from typing import Dict, List
+from prefect import flow, task
+from prefect.cache_policies import NO_CACHE
+from flows.transform import (
+    spark_submit_command, run_streaming, check_docker, start_spark_cluster, stop_spark_cluster,
+)
+from spark.schema_contract import TRANSFORMED_PREFIX, STATS_DIR, STATS_PREFIX
+from utils.config import load_config
+from utils.swap_lock import transformed_lock
+
+BACKFILL_PREFIX = "backfill"
+STATE_DIR = Path.cwd() / "backfill_state"
+# Resources per slice job, so concurrent slices share the standalone cluster
+# (two workers with 2 cores / 2G each) instead of the first job taking it all
+SLICE_SUBMIT_OPTIONS = ["--total-executor-cores", "2", "--executor-memory", "1g"]
+
+def is_aligned(d: date, slice_by: str) -> bool:
+    return d.day == 1 and (slice_by == "month" or d.month == 1)
+
+def next_slice(d: date, slice_by: str) -> date:
+    if slice_by == "year":
+        return date(d.year + 1, 1, 1)
+    return date(d.year + d.month // 12, d.month % 12 + 1, 1)
+
+def slice_partitions(start: date, end: date, mode: str) -> List[str]:
+    """Partition directories (relative to <prefix>/<mode>/) covered by [start, end)."""
+    partitions = []
+    current = start
+    while current < end:
+        if mode == "fundamentals":
+            partitions.append(f"year={current.year}")
+            current = next_slice(current, "year")
+        else:
+            partitions.append(f"year={current.year}/month={current.month}")
+            current = next_slice(current, "month")
+    return partitions
+
+def plan(mode: str, start: date, end: date, slice_by: str) -> Dict[str, dict]:
+    if mode == "fundamentals" and slice_by != "year":
+        raise ValueError("Fundamentals are partitioned by year; use --slice year")
+    # Slices must cover whole partitions, since each one replaces them wholesale
+    for d in (start, end):
+        if not is_aligned(d, slice_by):
+            raise ValueError(f"{d} is not the first day of a {slice_by}")
+    if end <= start:
+        raise ValueError("End date must be after start date")
+    slices = {}
+    current = start
+    while current < end:
+        upper = min(next_slice(current, slice_by), end)
+        label = f"{current:%Y}" if slice_by == "year" else f"{current:%Y-%m}"
+        slices[label] = {
+            "start": current.isoformat(),
+            "end": upper.isoformat(),
+            "status": "pending",
+            "attempts": 0,
+            "error": None,
+        }
+        current = upper
+    return slices
+
+class BackfillState:
+    """Per-slice status of the current run for a range, in backfill_state/<range>.json.
+
+    Finished runs are moved to backfill_state/archive/<run_id>.json.
+    """
+
+    def __init__(self, path: Path, data: dict):
+        self.path = path
+        self.data = data
+        self._lock = Lock()
+
+    @classmethod
+    def open(cls, mode: str, start: date, end: date, slice_by: str) -> "BackfillState":
+        key = f"{mode}-{start:%Y%m%d}-{end:%Y%m%d}-{slice_by}"
+        path = STATE_DIR / f"{key}.json"
+        if path.exists():
+            with open(path, 'r') as f:
+                state = cls(path, json.load(f))
+            if not state.data["swapped"]:
+                return state
+            # Swapped but stopped before archiving; start afresh
+            state.archive()
+        # Unique per run, so staging prefixes and lock owners never collide
+        # with an earlier or concurrent run of the same range
+        run_id = f"{key}-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{uuid.uuid4().hex[:6]}"
+        data = {
+            "run_id": run_id,
+            "mode": mode,
+            "slice_by": slice_by,
+            "slices": plan(mode, start, end, slice_by),
+            "swapped_partitions": [],
+            "swapped": False,
+        }
+        state = cls(path, data)
+        state.save()
+        return state
+
+    @property
+    def run_id(self) -> str:
+        return self.data["run_id"]
+
+    def update(self, label: str, **fields):
+        with self._lock:
+            self.data["slices"][label].update(fields)
+            self.save()
+
+    def save(self):
+        self.path.parent.mkdir(exist_ok=True)
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, 'w') as f:
+            json.dump(self.data, f, indent=2)
+        tmp.replace(self.path)
+
+    def archive(self):
+        archived = STATE_DIR / "archive" / f"{self.run_id}.json"
+        archived.parent.mkdir(parents=True, exist_ok=True)
+        self.path.replace(archived)
+
+    def pending(self) -> List[str]:
+        return [label for label, s in self.data["slices"].items() if s["status"] != "succeeded"]
+
+def staging_prefix(run_id: str, label: str) -> str:
+    return f"{BACKFILL_PREFIX}/{run_id}/{label}"
+
+def run_slice(state: BackfillState, label: str) -> bool:
+    config = load_config()
+    spec = state.data["slices"][label]
+    state.update(label, status="running", attempts=spec["attempts"] + 1, error=None)
+    cmd = spark_submit_command(
+        config, state.data["mode"],
+        job_args=[spec["start"], spec["end"], staging_prefix(state.run_id, label)],
+        submit_options=SLICE_SUBMIT_OPTIONS
+    )
+    try:
+        run_streaming(cmd, prefix=f"[{label}] ")
+    except subprocess.CalledProcessError as e:
+        # Keep the tail of the output; the Java stack trace is at the end
+        state.update(label, status="failed", finished_at=datetime.now(timezone.utc).isoformat(),
+                     error=e.output)
+        print(f"✗ Slice {label} failed (attempt {spec['attempts'] + 1})")
+        return False
+    state.update(label, status="succeeded", finished_at=datetime.now(timezone.utc).isoformat())
+    print(f"✓ Slice {label} rebuilt")
+    return True
+
+@task(name="run_backfill_slices", cache_policy=NO_CACHE)
+def run_slices(state: BackfillState, concurrency: int) -> List[str]:
+    labels = state.pending()
+    print(f"Running {len(labels)} slice(s) with concurrency {concurrency}...")
+    failed = []
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = {pool.submit(run_slice, state, label): label for label in labels}
+        for future in as_completed(futures):
+            if not future.result():
+                failed.append(futures[future])
+    return sorted(failed)
+
+def merge_stats(mode: str, current: dict, staged: List[dict], replaced: List[dict]) -> dict:
+    """Replace the swapped partitions' entries and recompute the totals.
+
+    Additive fields are summed and min/max combined across partitions.
+    Approximate distinct tickers cannot be merged exactly; the total keeps
+    the larger of the previous total and the largest per-partition figure,
+    which is exact when a rebuild does not change the set of tickers.
+    """
+    replaced_keys = {json.dumps(p, sort_keys=True) for p in replaced}
+    partitions = [p for p in current.get("partitions", [])
+                  if json.dumps(p["partition"], sort_keys=True) not in replaced_keys]
+    for stats in staged:
+        partitions.extend(stats["partitions"])
+
+    previous_tickers = current.get("total", {}).get("approx_distinct_tickers", 0)
+    total = {"row_count": 0, "approx_distinct_tickers": previous_tickers, "duplicate_keys": 0,
+             "null_counts": {}, "min": {}, "max": {}}
+    if mode == "prices":
+        # Present even with no partitions, as the load validation reads it
+        total["non_positive_close"] = 0
+    for p in partitions:
+        for key in ("row_count", "duplicate_keys", "non_positive_close"):
+            if key in p:
+                total[key] = total.get(key, 0) + p[key]
+        total["approx_distinct_tickers"] = max(total["approx_distinct_tickers"], p["approx_distinct_tickers"])
+        for column, count in p["null_counts"].items():
+            total["null_counts"][column] = total["null_counts"].get(column, 0) + count
+        for column, value in p["min"].items():
+            if value is not None and (total["min"].get(column) is None or value < total["min"][column]):
+                total["min"][column] = value
+        for column, value in p["max"].items():
+            if value is not None and (total["max"].get(column) is None or value > total["max"][column]):
+                total["max"][column] = value
+
+    merged = dict(current or (staged[0] if staged else {}))
+    merged.update({
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "total": total,
+        "partitions": partitions,
+    })
+    return merged
+
+@task(name="swap_backfill_partitions", cache_policy=NO_CACHE)
+def swap_partitions(state: BackfillState):
+    """Replace partitions in transformed/ with their rebuilt versions.
+
+    GCS has no directory rename, so each partition is replaced by copying the
+    new objects in and then deleting the old ones; readers could see both
+    while that runs. The whole swap therefore holds the transformed/ lock,
+    which stays in place if it fails so loads remain blocked until the
+    backfill is rerun. Swapped
+    partitions are recorded in the state file, so rerunning the backfill
+    resumes the swap where it stopped.
+    """
+    from prefect_gcp import GcsBucket
+    bucket = GcsBucket.load("gcs-bucket").get_bucket()
+    with transformed_lock(bucket, "backfill", owner=f"backfill {state.run_id}"):
+        replace_partitions(bucket, state)
+
+def replace_partitions(bucket, state: BackfillState):
+    mode = state.data["mode"]
+    done = set(state.data["swapped_partitions"])
+    staged_stats = []
+    replaced = []
+
+    for label, spec in state.data["slices"].items():
+        staging = staging_prefix(state.run_id, label)
+        stats_blob = bucket.blob(f"{staging}/{STATS_DIR}/{mode}.json")
+        if stats_blob.exists():
+            staged_stats.append(json.loads(stats_blob.download_as_bytes()))
+
+        start, end = date.fromisoformat(spec["start"]), date.fromisoformat(spec["end"])
+        for partition in slice_partitions(start, end, mode):
+            replaced.append(dict(kv.split("=") for kv in partition.split("/")))
+            if partition in done:
+                continue
+            source = f"{staging}/{mode}/{partition}/"
+            target = f"{TRANSFORMED_PREFIX}/{mode}/{partition}/"
+            new_blobs = [b for b in bucket.list_blobs(prefix=source) if not b.name.endswith("_SUCCESS")]
+            old_blobs = list(bucket.list_blobs(prefix=target))
+            new_names = set()
+            for blob in new_blobs:
+                name = target + blob.name[len(source):]
+                bucket.copy_blob(blob, bucket, name)
+                new_names.add(name)
+            for blob in old_blobs:
+                if blob.name not in new_names:
+                    blob.delete()
+            done.add(partition)
+            state.data["swapped_partitions"] = sorted(done)
+            state.save()
+            print(f"✓ Swapped {mode}/{partition} ({len(new_blobs)} file(s))")
+
+    # Stats partition values are ints in the JSON written by Spark
+    replaced = [{k: int(v) for k, v in p.items()} for p in replaced]
+    stats_blob = bucket.blob(f"{STATS_PREFIX}/{mode}.json")
+    current = json.loads(stats_blob.download_as_bytes()) if stats_blob.exists() else {}
+    merged = merge_stats(mode, current, staged_stats, replaced)
+    stats_blob.upload_from_string(json.dumps(merged, default=str, indent=2), content_type="application/json")
+    print(f"✓ Updated {STATS_PREFIX}/{mode}.json")
+
+    for blob in bucket.list_blobs(prefix=f"{BACKFILL_PREFIX}/{state.run_id}/"):
+        blob.delete()
+    state.data["swapped"] = True
+    state.save()
+
+@flow(name="backfill_transformed_data", log_prints=True)
+def backfill_flow(mode: str, start: date, end: date, slice_by: str = "month", concurrency: int = 2):
+    state = BackfillState.open(mode, start, end, slice_by)
+    print(f"Backfill {state.run_id}: {len(state.data['slices'])} slice(s), "
+          f"{len(state.pending())} pending")
+
+    if state.pending():
+        check_docker()
+        start_spark_cluster()
+        try:
+            failed = run_slices(state, concurrency)
+        finally:
+            stop_spark_cluster()
+    else:
+        failed = []
+    if failed:
+        print(f"\n✗ {len(failed)} slice(s) failed: {', '.join(failed)}")
+        print("Rerun the same command to retry only the failed slices.")
+        raise RuntimeError(f"Backfill {state.run_id} incomplete")
+
+    swap_partitions(state)
+    state.archive()
+    print(f"\n✓ Backfill {state.run_id} completed and swapped into {TRANSFORMED_PREFIX}/{mode}/")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rebuild transformed history in parallel slices")
+    parser.add_argument("mode", choices=["fundamentals", "prices"])
+    parser.add_argument("start", type=date.fromisoformat, help="First day of the range (inclusive)")
+    parser.add_argument("end", type=date.fromisoformat, help="Day after the range (exclusive)")
+    parser.add_argument("--slice", dest="slice_by", choices=["year", "month"], default="month")
+    parser.add_argument("--concurrency", type=int, default=2)
+    args = parser.parse_args()
+    backfill_flow(args.mode, args.start, args.end, args.slice_by, args.concurrency)
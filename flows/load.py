@@ -1,85 +1,80 @@
-from google.cloud import bigquery
+import json
+from typing import TYPE_CHECKING
 from prefect import flow, task
 from prefect.cache_policies import NO_CACHE
-from utils.config import CONFIG, CREDENTIALS_PATH
+from utils.config import load_config, get_credentials_path
+from utils.swap_lock import transformed_lock
+from spark.schema_contract import (
+    STATS_PREFIX, column_names,
+    FUNDAMENTALS_SCHEMA, FUNDAMENTALS_PARTITIONS, PRICES_SCHEMA, PRICES_PARTITIONS,
+)
+
+if TYPE_CHECKING:
+    from google.cloud import bigquery
+
+def materialized_columns(schema, partitions) -> str:
+    # Contract types already match the table, so columns are selected as-is;
+    # partition keys are exposed as Year/Month
+    return ", ".join(column_names(schema) + [f"{p.name} AS {p.name.capitalize()}" for p in partitions])
 
 @task(name="create_bigquery_client", retries=0)
 def create_client():
+    from google.cloud import bigquery
+    config = load_config()
     client = bigquery.Client.from_service_account_json(
-        str(CREDENTIALS_PATH),
-        project=CONFIG['project-name']
+        str(get_credentials_path()),
+        project=config['project-name']
     )
-    print(f"✓ BigQuery client created for project {CONFIG['project-name']}")
+    print(f"✓ BigQuery client created for project {config['project-name']}")
     return client
 
 @task(name="setup_bigquery_environment", cache_policy=NO_CACHE)
-def setup_environment(client: bigquery.Client):
-    dataset_id = f"{CONFIG['project-name']}.{CONFIG['dataset-name']}"
+def setup_environment(client: "bigquery.Client"):
+    from google.cloud import bigquery
+    config = load_config()
+    dataset_id = f"{config['project-name']}.{config['dataset-name']}"
     dataset = bigquery.Dataset(dataset_id)
     dataset.location = "US"
     client.create_dataset(dataset, exists_ok=True)
-    print(f"✓ Dataset {CONFIG['dataset-name']} verified/created")
+    print(f"✓ Dataset {config['dataset-name']} verified/created")
 
 @task(name="register_external_tables", retries=2, cache_policy=NO_CACHE)
-def register_external_tables(client: bigquery.Client):
+def register_external_tables(client: "bigquery.Client"):
+    from google.cloud import bigquery
     print("Registering external tables with Hive partitioning...")
-    dataset_id = CONFIG['dataset-name']
-    bucket = CONFIG['bucket-name']
+    config = load_config()
+    dataset_id = config['dataset-name']
+    bucket = config['bucket-name']
     
-    fundamentals_schema = [
-        bigquery.SchemaField("Ticker", "STRING"),
-        bigquery.SchemaField("Company_Name", "STRING"),
-        bigquery.SchemaField("Revenue", "FLOAT"),
-        bigquery.SchemaField("Net_Income", "FLOAT"),
-        bigquery.SchemaField("Pretax_Income_Loss_Adj", "FLOAT"),
-        bigquery.SchemaField("Profit_Margin", "FLOAT"),
-        bigquery.SchemaField("ROE", "FLOAT"),
-        bigquery.SchemaField("ROA", "FLOAT"),
-        bigquery.SchemaField("Debt_to_Equity", "FLOAT"),
-        bigquery.SchemaField("Current_Ratio", "FLOAT")
-    ]
-
-    prices_schema = [
-        bigquery.SchemaField("Ticker", "STRING"),
-        bigquery.SchemaField("Date", "STRING"), 
-        bigquery.SchemaField("Open", "FLOAT"),
-        bigquery.SchemaField("High", "FLOAT"),
-        bigquery.SchemaField("Low", "FLOAT"),
-        bigquery.SchemaField("Close", "FLOAT"),
-        bigquery.SchemaField("Adj_Close", "FLOAT"),
-        bigquery.SchemaField("Volume", "INTEGER"),
-        bigquery.SchemaField("Volume_Millions", "FLOAT"),
-        bigquery.SchemaField("Daily_Return", "FLOAT")
-    ]
-
     table_configs = {
         "stock_fundamentals_external": {
             "uri": f"gs://{bucket}/transformed/fundamentals/*",
             "partition_prefix": f"gs://{bucket}/transformed/fundamentals",
-            "schema": fundamentals_schema
+            "schema": FUNDAMENTALS_SCHEMA,
+            "partitions": FUNDAMENTALS_PARTITIONS
         },
         "stock_prices_external": {
             "uri": f"gs://{bucket}/transformed/prices/*",
             "partition_prefix": f"gs://{bucket}/transformed/prices",
-            "schema": prices_schema
+            "schema": PRICES_SCHEMA,
+            "partitions": PRICES_PARTITIONS
         }
     }
 
     for table_name, paths in table_configs.items():
-        table_id = f"{CONFIG['project-name']}.{dataset_id}.{table_name}"
+        table_id = f"{config['project-name']}.{dataset_id}.{table_name}"
         external_config = bigquery.ExternalConfig("PARQUET")
         external_config.source_uris = [paths["uri"]]
-        
-        if paths["schema"]:
-            external_config.schema = paths["schema"]
-            external_config.autodetect = False
-        else:
-            external_config.autodetect = True
-        
+        external_config.schema = [bigquery.SchemaField(c.name, c.type) for c in paths["schema"]]
+        external_config.autodetect = False
+
         external_config.parquet_options.enable_list_inference = True
+        # Typed partition keys from the contract, e.g. .../{year:INTEGER}/{month:INTEGER}
         hive_options = bigquery.HivePartitioningOptions()
-        hive_options.mode = "STRINGS"
-        hive_options.source_uri_prefix = paths["partition_prefix"]
+        hive_options.mode = "CUSTOM"
+        hive_options.source_uri_prefix = paths["partition_prefix"] + "".join(
+            f"/{{{p.name}:{p.type}}}" for p in paths["partitions"]
+        )
         external_config.hive_partitioning = hive_options
 
         table = bigquery.Table(table_id)
@@ -89,19 +84,16 @@ def register_external_tables(client: bigquery.Client):
         print(f"✓ Registered external table: {table_name}")
 
 @task(name="create_materialized_fundamentals_table", retries=2, cache_policy=NO_CACHE)
-def create_fundamentals_table(client: bigquery.Client):
+def create_fundamentals_table(client: "bigquery.Client"):
     print("Creating materialized fundamentals table...")
-    dataset_id = CONFIG['dataset-name']
-    table_id = f"{CONFIG['project-name']}.{dataset_id}.stock_fundamentals"
+    config = load_config()
+    dataset_id = config['dataset-name']
+    table_id = f"{config['project-name']}.{dataset_id}.stock_fundamentals"
     
     query = f"""
     CREATE OR REPLACE TABLE `{table_id}` AS
-    SELECT 
-        Ticker, Company_Name, Revenue, Net_Income,
-        Pretax_Income_Loss_Adj, Profit_Margin, ROE, ROA,
-        Debt_to_Equity, Current_Ratio,
-        CAST(Year AS INT64) as Year
-    FROM `{CONFIG['project-name']}.{dataset_id}.stock_fundamentals_external`
+    SELECT {materialized_columns(FUNDAMENTALS_SCHEMA, FUNDAMENTALS_PARTITIONS)}
+    FROM `{config['project-name']}.{dataset_id}.stock_fundamentals_external`
     WHERE Revenue IS NOT NULL
     """
     query_job = client.query(query)
@@ -112,20 +104,16 @@ def create_fundamentals_table(client: bigquery.Client):
     return table_id
 
 @task(name="create_materialized_prices_table", retries=2, cache_policy=NO_CACHE)
-def create_prices_table(client: bigquery.Client):
+def create_prices_table(client: "bigquery.Client"):
     print("Creating materialized prices table...")
-    dataset_id = CONFIG['dataset-name']
-    table_id = f"{CONFIG['project-name']}.{dataset_id}.stock_prices"
+    config = load_config()
+    dataset_id = config['dataset-name']
+    table_id = f"{config['project-name']}.{dataset_id}.stock_prices"
     
     query = f"""
     CREATE OR REPLACE TABLE `{table_id}` AS
-    SELECT 
-        Ticker,
-        CAST(Date AS DATE) as Date,
-        Open, High, Low, Close, Adj_Close, Volume, Volume_Millions, Daily_Return,
-        CAST(Year AS INT64) as Year,
-        CAST(Month AS INT64) as Month
-    FROM `{CONFIG['project-name']}.{dataset_id}.stock_prices_external`
+    SELECT {materialized_columns(PRICES_SCHEMA, PRICES_PARTITIONS)}
+    FROM `{config['project-name']}.{dataset_id}.stock_prices_external`
     WHERE Close > 0
     """
     query_job = client.query(query)
@@ -136,50 +124,51 @@ def create_prices_table(client: bigquery.Client):
     return table_id
 
 @task(name="create_aggregated_views", retries=1, cache_policy=NO_CACHE)
-def create_aggregated_views(client: bigquery.Client):
+def create_aggregated_views(client: "bigquery.Client"):
     print("Creating aggregated analysis views...")
-    dataset_id = CONFIG['dataset-name']
+    config = load_config()
+    dataset_id = config['dataset-name']
     view_queries = {
         "annual_company_metrics": f"""
-        CREATE OR REPLACE VIEW `{CONFIG['project-name']}.{dataset_id}.annual_company_metrics` AS
+        CREATE OR REPLACE VIEW `{config['project-name']}.{dataset_id}.annual_company_metrics` AS
         SELECT 
-            Ticker, Company_Name, Year,
+            Ticker, Year,
             AVG(Revenue) as Avg_Revenue,
             AVG(Net_Income) as Avg_Net_Income,
-            AVG(Profit_Margin) as Avg_Profit_Margin,
+            AVG(Net_Margin) as Avg_Net_Margin,
             AVG(ROE) as Avg_ROE,
             AVG(ROA) as Avg_ROA,
             AVG(Debt_to_Equity) as Avg_Debt_to_Equity,
             AVG(Current_Ratio) as Avg_Current_Ratio
-        FROM `{CONFIG['project-name']}.{dataset_id}.stock_fundamentals`
-        GROUP BY Ticker, Company_Name, Year
+        FROM `{config['project-name']}.{dataset_id}.stock_fundamentals`
+        GROUP BY Ticker, Year
         ORDER BY Year DESC, Ticker
         """,
         "monthly_price_stats": f"""
-        CREATE OR REPLACE VIEW `{CONFIG['project-name']}.{dataset_id}.monthly_price_stats` AS
+        CREATE OR REPLACE VIEW `{config['project-name']}.{dataset_id}.monthly_price_stats` AS
         SELECT 
             Ticker, Year, Month,
             COUNT(*) as Trading_Days,
             AVG(Close) as Avg_Close_Price,
             MIN(Low) as Month_Low,
             MAX(High) as Month_High,
-            SUM(Volume_Millions) as Total_Volume_Millions,
+            SUM(Volume) / 1e6 as Total_Volume_Millions,
             AVG(Daily_Return) as Avg_Daily_Return
-        FROM `{CONFIG['project-name']}.{dataset_id}.stock_prices`
+        FROM `{config['project-name']}.{dataset_id}.stock_prices`
         GROUP BY Ticker, Year, Month
         ORDER BY Year DESC, Month DESC, Ticker
         """,
         "top_performers": f"""
-        CREATE OR REPLACE VIEW `{CONFIG['project-name']}.{dataset_id}.top_performers` AS
+        CREATE OR REPLACE VIEW `{config['project-name']}.{dataset_id}.top_performers` AS
         WITH latest_year AS (
-            SELECT MAX(Year) as max_year FROM `{CONFIG['project-name']}.{dataset_id}.stock_fundamentals`
+            SELECT MAX(Year) as max_year FROM `{config['project-name']}.{dataset_id}.stock_fundamentals`
         )
         SELECT 
-            f.Ticker, f.Company_Name, f.Year, f.Revenue, f.Net_Income,
-            f.Profit_Margin, f.ROE, f.ROA
-        FROM `{CONFIG['project-name']}.{dataset_id}.stock_fundamentals` f
+            f.Ticker, f.Year, f.Revenue, f.Net_Income,
+            f.Net_Margin, f.ROE, f.ROA
+        FROM `{config['project-name']}.{dataset_id}.stock_fundamentals` f
         CROSS JOIN latest_year ly
-        WHERE f.Year = ly.max_year AND f.Revenue > 1000000000 AND f.Profit_Margin > 10
+        WHERE f.Year = ly.max_year AND f.Revenue > 1000000000 AND f.Net_Margin > 0.10
         ORDER BY f.Revenue DESC LIMIT 50
         """
     }
@@ -189,36 +178,79 @@ def create_aggregated_views(client: bigquery.Client):
         print(f"✓ Created view: {view_name}")
     return list(view_queries.keys())
 
+@task(name="load_transform_stats", retries=1, cache_policy=NO_CACHE)
+def load_transform_stats(mode: str) -> dict:
+    # Sidecar written by the Spark job alongside transformed/<mode>/
+    from prefect_gcp import GcsBucket
+    gcs_bucket = GcsBucket.load("gcs-bucket")
+    stats = json.loads(gcs_bucket.read_path(f"{STATS_PREFIX}/{mode}.json"))
+    print(f"✓ Loaded {mode} transform statistics "
+          f"({len(stats['partitions'])} partitions, generated {stats['generated_at']})")
+    return stats
+
 @task(name="validate_data_quality", retries=1, cache_policy=NO_CACHE)
-def validate_data(client: bigquery.Client):
+def validate_data(client: "bigquery.Client", fundamentals_stats: dict, prices_stats: dict):
+    """Check materialized tables against transform-time statistics.
+
+    Row counts come from table metadata, so no query scans the tables.
+    """
     print("Validating data quality...")
-    dataset_id = CONFIG['dataset-name']
-    checks = [
-        {"name": "Fundamentals row count", "query": f"SELECT COUNT(*) as count FROM `{CONFIG['project-name']}.{dataset_id}.stock_fundamentals`"},
-        {"name": "Prices row count", "query": f"SELECT COUNT(*) as count FROM `{CONFIG['project-name']}.{dataset_id}.stock_prices`"},
-        {"name": "Unique tickers in fundamentals", "query": f"SELECT COUNT(DISTINCT Ticker) as count FROM `{CONFIG['project-name']}.{dataset_id}.stock_fundamentals`"},
-        {"name": "Unique tickers in prices", "query": f"SELECT COUNT(DISTINCT Ticker) as count FROM `{CONFIG['project-name']}.{dataset_id}.stock_prices`"}
+    config = load_config()
+    dataset_id = f"{config['project-name']}.{config['dataset-name']}"
+    f_total = fundamentals_stats["total"]
+    p_total = prices_stats["total"]
+
+    # Mirror the WHERE clauses of the materialized table queries
+    expected_fundamentals = f_total["row_count"] - f_total["null_counts"].get("Revenue", 0)
+    non_positive_close = p_total.get("non_positive_close", 0)
+    expected_prices = (p_total["row_count"] - p_total["null_counts"].get("Close", 0)
+                       - non_positive_close)
+    row_checks = [
+        ("Fundamentals row count", client.get_table(f"{dataset_id}.stock_fundamentals").num_rows, expected_fundamentals),
+        ("Prices row count", client.get_table(f"{dataset_id}.stock_prices").num_rows, expected_prices),
     ]
+
     results = {}
-    for check in checks:
-        query_job = client.query(check["query"])
-        result = list(query_job.result())[0]
-        results[check["name"]] = result['count']
-        print(f"  {check['name']}: {result['count']:,}")
+    failures = []
+    for name, actual, expected in row_checks:
+        results[name] = actual
+        if actual == expected:
+            print(f"  ✓ {name}: {actual:,}")
+        else:
+            print(f"  ✗ {name}: {actual:,} (transform stats expect {expected:,})")
+            failures.append(name)
+
+    results["Unique tickers in fundamentals (approx)"] = f_total["approx_distinct_tickers"]
+    results["Unique tickers in prices (approx)"] = p_total["approx_distinct_tickers"]
+    results["Duplicate (Ticker, Report_Date) keys in fundamentals"] = f_total["duplicate_keys"]
+    results["Duplicate (Ticker, Date) keys in prices"] = p_total["duplicate_keys"]
+    results["Non-positive closes in prices"] = non_positive_close
+    for name in list(results)[len(row_checks):]:
+        print(f"  {name}: {results[name]:,}")
+
+    if failures:
+        raise RuntimeError(f"Validation failed: {', '.join(failures)}")
     return results
 
 @flow(name="load_to_bigquery", log_prints=True)
 def load_flow():
+    config = load_config()
     print("Starting BigQuery load flow")
-    print(f"Project: {CONFIG['project-name']}")
-    print(f"Dataset: {CONFIG['dataset-name']}")
+    print(f"Project: {config['project-name']}")
+    print(f"Dataset: {config['dataset-name']}")
     client = create_client()
     setup_environment(client)
-    register_external_tables(client)
-    fundamentals_table = create_fundamentals_table(client)
-    prices_table = create_prices_table(client)
-    views = create_aggregated_views(client)
-    validation_results = validate_data(client)
+    from prefect_gcp import GcsBucket
+    # Writers rewrite transformed/ object by object, so hold the lock until
+    # the materialized tables are built and checked against the stats
+    with transformed_lock(GcsBucket.load("gcs-bucket").get_bucket(), "load", keep_on_error=False):
+        register_external_tables(client)
+        fundamentals_table = create_fundamentals_table(client)
+        prices_table = create_prices_table(client)
+        views = create_aggregated_views(client)
+        fundamentals_stats = load_transform_stats("fundamentals")
+        prices_stats = load_transform_stats("prices")
+        validation_results = validate_data(client, fundamentals_stats, prices_stats)
     print("\n✓ Load flow completed successfully")
     print(f"\nMaterialized Tables:")
     print(f"  - {fundamentals_table}")
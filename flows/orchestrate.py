@@ -1,28 +1,44 @@
+import argparse
+from typing import Optional
 from prefect import flow
 from flows.extract import extract_flow
 from flows.transform import transform_flow
 from flows.load import load_flow
-from utils.config import CONFIG
+from utils.config import load_config, get_data_root
 
 
 @flow(name="stock_data_etl_pipeline", log_prints=True)
-def orchestrate_pipeline():
+def orchestrate_pipeline(colocated: bool = False, data_root: Optional[str] = None):
+    """Run extract, transform and load.
+
+    With colocated=True, extract and transform share a local data_root:
+    raw data never goes to GCS, Spark runs in-process, and only the
+    transformed output is uploaded before the load.
+    """
+    config = load_config()
+    if colocated:
+        # Fail before extracting if data_root is not a local directory
+        get_data_root(data_root)
     print("="*60)
     print("STOCK DATA ETL PIPELINE")
     print("="*60)
-    print(f"Project: {CONFIG['project-name']}")
-    print(f"Bucket: {CONFIG['bucket-name']}")
-    print(f"Dataset: {CONFIG['dataset-name']}")
-    print(f"Region: {CONFIG['region']}")
+    print(f"Project: {config['project-name']}")
+    print(f"Bucket: {config['bucket-name']}")
+    print(f"Dataset: {config['dataset-name']}")
+    print(f"Region: {config['region']}")
+    print(f"Mode: {'co-located (local Spark, raw data kept local)' if colocated else 'docker Spark cluster'}")
     print("="*60)
     
     print("\n[PHASE 1/3] EXTRACT - Fetching data from SimFin API")
     print("-"*60)
-    extract_flow()
+    extract_flow(colocated, data_root)
     
     print("\n[PHASE 2/3] TRANSFORM - Processing with Spark")
     print("-"*60)
-    transform_flow()
+    if colocated:
+        transform_flow(runner="local", data_root=data_root, upload=True)
+    else:
+        transform_flow()
     
     print("\n[PHASE 3/3] LOAD - Loading into BigQuery")
     print("-"*60)
@@ -33,14 +49,19 @@ def orchestrate_pipeline():
     print("="*60)
     print("\nNext Steps:")
     print("1. Open Google Cloud Console → BigQuery")
-    print(f"2. Navigate to dataset: {CONFIG['dataset-name']}")
+    print(f"2. Navigate to dataset: {config['dataset-name']}")
     print("3. Query the materialized tables and views")
     print("4. Create a Looker Studio dashboard connected to BigQuery")
     print("\nSuggested BigQuery queries to try:")
-    print(f"  SELECT * FROM `{CONFIG['project-name']}.{CONFIG['dataset-name']}.top_performers` LIMIT 10")
-    print(f"  SELECT * FROM `{CONFIG['project-name']}.{CONFIG['dataset-name']}.annual_company_metrics` WHERE Year >= 2020")
-    print(f"  SELECT * FROM `{CONFIG['project-name']}.{CONFIG['dataset-name']}.monthly_price_stats` WHERE Year = 2023")
+    print(f"  SELECT * FROM `{config['project-name']}.{config['dataset-name']}.top_performers` LIMIT 10")
+    print(f"  SELECT * FROM `{config['project-name']}.{config['dataset-name']}.annual_company_metrics` WHERE Year >= 2020")
+    print(f"  SELECT * FROM `{config['project-name']}.{config['dataset-name']}.monthly_price_stats` WHERE Year = 2023")
 
 
 if __name__ == "__main__":
-    orchestrate_pipeline()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Run the stock data ETL pipeline")
+    parser.add_argument("--colocated", action="store_true",
+                        help="Keep raw data local and run Spark in-process")
+    parser.add_argument("--data-root", help="Local directory for co-located runs (default ./data_lake)")
+    args = parser.parse_args()
+    orchestrate_pipeline(args.colocated, args.data_root)
\ No newline at end of file
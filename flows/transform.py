@@ -1,6 +1,29 @@
+import argparse
+import os
 import subprocess
+from collections import deque
+from pathlib import Path
+from typing import Optional
 from prefect import flow, task
-from utils.config import CONFIG, CREDENTIALS_PATH
+from spark.schema_contract import TRANSFORMED_PREFIX
+from utils.config import load_config, get_credentials_path, get_data_root
+from utils.swap_lock import transformed_lock
+
+def spark_submit_command(config, mode, job_args=(), submit_options=()):
+    """spark-submit invocation of the transform job on the docker cluster."""
+    return [
+        "docker", "exec", "spark-master",
+        "/opt/spark/bin/spark-submit",
+        "--master", "spark://spark-master:7077",
+        "--deploy-mode", "client",
+        *submit_options,
+        "/opt/spark-apps/transform_stock_data.py",
+        config['project-name'],
+        "/opt/spark-apps/gcp_credentials.json",
+        config['bucket-name'],
+        mode,
+        *job_args
+    ]
 
 @task(name="check_docker_running", retries=0)
 def check_docker():
@@ -35,61 +58,168 @@ def start_spark_cluster():
         print(f"Error starting Spark cluster: {e.stderr}")
         raise
 
+def run_streaming(cmd, prefix=""):
+    """Run a command, printing its combined output line by line as it arrives."""
+    tail = deque(maxlen=50)
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT,
+                          text=True, bufsize=1) as proc:
+        for line in proc.stdout:
+            line = line.rstrip()
+            tail.append(line)
+            print(f"{prefix}{line}")
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output="\n".join(tail))
+
+CGROUP_ROOT = Path("/sys/fs/cgroup")
+# cgroup v1 reports an unlimited memory limit as a huge page-aligned value
+CGROUP_UNLIMITED = 1 << 60
+
+def cgroup_dirs(controller):
+    """Directories that may hold this process's cgroup files for ``controller``."""
+    dirs = []
+    try:
+        with open("/proc/self/cgroup") as f:
+            for line in f:
+                _, controllers, path = line.strip().split(":", 2)
+                if controllers == "" or controller in controllers.split(","):
+                    # v2 has a single unified hierarchy; v1 mounts one per controller
+                    base = CGROUP_ROOT if controllers == "" else CGROUP_ROOT / controllers
+                    dirs.append(base / path.lstrip("/"))
+                    # Inside a cgroup namespace the process's own cgroup is the mount root
+                    dirs.append(base)
+    except OSError:
+        pass
+    return dirs
+
+def read_cgroup(controller, *names):
+    for directory in cgroup_dirs(controller):
+        for name in names:
+            try:
+                return (directory / name).read_text().split()
+            except OSError:
+                continue
+    return None
+
+def cgroup_memory_limit():
+    value = read_cgroup("memory", "memory.max", "memory.limit_in_bytes")
+    if not value or value[0] == "max" or int(value[0]) >= CGROUP_UNLIMITED:
+        return None
+    return int(value[0])
+
+def cgroup_cpu_quota():
+    value = read_cgroup("cpu", "cpu.max")
+    if value:
+        return None if value[0] == "max" else int(value[0]) / int(value[1])
+    quota = read_cgroup("cpu", "cpu.cfs_quota_us")
+    period = read_cgroup("cpu", "cpu.cfs_period_us")
+    if quota and period and int(quota[0]) > 0:
+        return int(quota[0]) / int(period[0])
+    return None
+
+def available_cores():
+    """CPUs this process may use: its affinity mask, capped by any cgroup CPU quota."""
+    try:
+        cores = len(os.sched_getaffinity(0))
+    except AttributeError:
+        # sched_getaffinity is unavailable on Windows and macOS
+        cores = os.cpu_count() or 1
+    quota = cgroup_cpu_quota()
+    if quota:
+        cores = min(cores, max(1, int(quota)))
+    return cores
+
+def available_memory():
+    """Host memory, capped by the container's cgroup memory limit when one is set."""
+    try:
+        memory = os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (AttributeError, ValueError, OSError):
+        # os.sysconf is unavailable on Windows
+        memory = 8 * 1024 ** 3
+    limit = cgroup_memory_limit()
+    return min(memory, limit) if limit else memory
+
+def local_spark_settings(cores=None):
+    """local[N] master and driver sizing derived from the resources this process may use."""
+    cores = cores or available_cores()
+    # Executors run inside the driver JVM in local mode, so the driver gets
+    # most of the available memory, leaving headroom for Python and the OS
+    driver_gb = max(1, int(available_memory() * 0.6 / 1024 ** 3))
+    return f"local[{cores}]", {
+        "spark.driver.memory": f"{driver_gb}g",
+        "spark.sql.shuffle.partitions": str(cores * 2),
+        "spark.ui.enabled": "false",
+    }
+
+def run_local(config, mode, data_root):
+    # pyspark is only needed by this runner, so import it here
+    from spark.transform_stock_data import main as run_transform_job
+    # The job maps bare names to gs:// buckets, so always hand it an explicit URI
+    root = data_root if data_root and data_root.startswith("gs://") else get_data_root(data_root).as_uri()
+    master, spark_conf = local_spark_settings()
+    print(f"Running {mode} transform in-process on {master} "
+          f"(driver memory {spark_conf['spark.driver.memory']}) against {root}")
+    credentials = str(get_credentials_path()) if root.startswith("gs://") else None
+    # spark.driver.memory only applies when this call starts the JVM
+    run_transform_job(config['project-name'], credentials, root, mode,
+                      master=master, conf=spark_conf)
+
+def run_transform(mode, runner, data_root):
+    config = load_config()
+    if runner == "local":
+        run_local(config, mode, data_root)
+    elif runner == "docker":
+        try:
+            run_streaming(spark_submit_command(config, mode))
+        except subprocess.CalledProcessError as e:
+            print(f"Error during transformation (exit code {e.returncode})")
+            raise
+    else:
+        raise ValueError(f"Unknown Spark runner: {runner!r} (expected 'docker' or 'local')")
+
 @task(name="transform_fundamentals", retries=1)
-def transform_fundamentals():
+def transform_fundamentals(runner: str = "docker", data_root: Optional[str] = None):
     print("Transforming fundamentals data with Spark...")
-    cmd = [
-        "docker", "exec", "spark-master",
-        "/opt/spark/bin/spark-submit",
-        "--master", "spark://spark-master:7077",
-        "--deploy-mode", "client",
-        "/opt/spark-apps/transform_stock_data.py",
-        CONFIG['project-name'],
-        "/opt/spark-apps/gcp_credentials.json",
-        CONFIG['bucket-name'],
-        "fundamentals"
-    ]
-    try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        print(result.stdout)
-        print("✓ Fundamentals transformation completed")
-    except subprocess.CalledProcessError as e:
-        print(f"Error during transformation: {e.stderr}")
-        print(f"Stdout: {e.stdout}")
-        raise
+    run_transform("fundamentals", runner, data_root)
+    print("✓ Fundamentals transformation completed")
 
 @task(name="transform_prices", retries=1)
-def transform_prices():
+def transform_prices(runner: str = "docker", data_root: Optional[str] = None):
     print("Transforming price data with Spark...")
-    cmd = [
-        "docker", "exec", "spark-master",
-        "/opt/spark/bin/spark-submit",
-        "--master", "spark://spark-master:7077",
-        "--deploy-mode", "client",
-        "/opt/spark-apps/transform_stock_data.py",
-        CONFIG['project-name'],
-        "/opt/spark-apps/gcp_credentials.json",
-        CONFIG['bucket-name'],
-        "prices"
-    ]
-    try:
-        result = subprocess.run(
-            cmd,
-            capture_output=True,
-            text=True,
-            check=True
-        )
-        print(result.stdout)
-        print("✓ Prices transformation completed")
-    except subprocess.CalledProcessError as e:
-        print(f"Error during transformation: {e.stderr}")
-        print(f"Stdout: {e.stdout}")
-        raise
+    run_transform("prices", runner, data_root)
+    print("✓ Prices transformation completed")
+
+@task(name="upload_transformed_to_gcs", retries=1)
+def upload_transformed(data_root: Optional[str] = None):
+    """Mirror the local transformed/ tree into the bucket.
+
+    Used after a co-located run, so the only GCS traffic is the transformed
+    output. Objects under transformed/ that the run did not produce are
+    removed, matching Spark's overwrite semantics. Objects are replaced one
+    at a time, so the upload holds the transformed/ lock to keep loads out.
+    """
+    from prefect_gcp import GcsBucket
+    gcs_bucket = GcsBucket.load("gcs-bucket")
+    local_root = get_data_root(data_root) / TRANSFORMED_PREFIX
+    with transformed_lock(gcs_bucket.get_bucket(), "upload"):
+        mirror_transformed(gcs_bucket, local_root)
+
+def mirror_transformed(gcs_bucket, local_root):
+    uploaded = set()
+    for path in sorted(local_root.rglob("*")):
+        # Skip directories and Hadoop's local checksum files
+        if path.is_dir() or path.name.endswith(".crc"):
+            continue
+        gcs_path = f"{TRANSFORMED_PREFIX}/{path.relative_to(local_root).as_posix()}"
+        gcs_bucket.upload_from_path(from_path=path, to_path=gcs_path)
+        uploaded.add(gcs_path)
+    print(f"✓ Uploaded {len(uploaded)} file(s) to gs://{gcs_bucket.bucket}/{TRANSFORMED_PREFIX}/")
+
+    stale = [b for b in gcs_bucket.get_bucket().list_blobs(prefix=f"{TRANSFORMED_PREFIX}/")
+             if b.name not in uploaded]
+    for blob in stale:
+        blob.delete()
+    if stale:
+        print(f"✓ Removed {len(stale)} stale object(s)")
 
 @task(name="stop_spark_cluster")
 def stop_spark_cluster():
@@ -106,20 +236,48 @@ def stop_spark_cluster():
         print(f"Warning: Could not stop Spark cluster: {e.stderr}")
 
 @flow(name="transform_stock_data", log_prints=True)
-def transform_flow():
+def transform_flow(runner: str = "docker", data_root: Optional[str] = None, upload: bool = False):
+    """Run the Spark transforms.
+
+    runner="docker" submits to the docker-compose cluster against the GCS
+    bucket. runner="local" runs the job in this process on local[N], reading
+    and writing ``data_root`` (a local directory or file:// URI, default
+    ./data_lake) with the same raw/ and transformed/ layout. With upload=True
+    the local transformed/ output is then copied to the bucket.
+    """
+    config = load_config()
+    if upload:
+        # Only a local data root has output to upload
+        get_data_root(data_root)
     print("Starting Spark transformation flow")
-    print(f"Project: {CONFIG['project-name']}")
-    print(f"Bucket: {CONFIG['bucket-name']}")
-    check_docker()
-    start_spark_cluster()
-    try:
-        transform_fundamentals()
-        transform_prices()
-        print("\n✓ Transform flow completed successfully")
-        print("  - Fundamentals transformed and partitioned by Year/Quarter")
-        print("  - Prices transformed and partitioned by Year/Month")
-    finally:
-        stop_spark_cluster()
+    print(f"Project: {config['project-name']}")
+    print(f"Runner: {runner}")
+    if runner == "local":
+        transform_fundamentals(runner, data_root)
+        transform_prices(runner, data_root)
+        if upload:
+            upload_transformed(data_root)
+    else:
+        print(f"Bucket: {config['bucket-name']}")
+        from prefect_gcp import GcsBucket
+        check_docker()
+        start_spark_cluster()
+        try:
+            # The jobs overwrite transformed/ in place
+            with transformed_lock(GcsBucket.load("gcs-bucket").get_bucket(), "transform"):
+                transform_fundamentals(runner)
+                transform_prices(runner)
+        finally:
+            stop_spark_cluster()
+    print("\n✓ Transform flow completed successfully")
+    print("  - Fundamentals transformed and partitioned by Year")
+    print("  - Prices transformed and partitioned by Year/Month")
 
 if __name__ == "__main__":
-    transform_flow()
+    parser = argparse.ArgumentParser(description="Run the Spark transforms")
+    parser.add_argument("--runner", choices=["docker", "local"], default="docker")
+    parser.add_argument("--data-root", help="Local directory or file:// URI for the local runner")
+    parser.add_argument("--upload", action="store_true", help="Upload local transformed/ output to GCS")
+    args = parser.parse_args()
+    transform_flow(args.runner, args.data_root, args.upload)
+
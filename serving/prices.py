@@ -0,0 +1,270 @@
+"""Low-latency ticker lookups over the transformed price Parquet layout.
+
+The Spark job writes one ``transformed/prices/year=YYYY/month=M/part-*.parquet``
+file per month, sorted by Ticker and Date with small row groups, so each row
+group covers a narrow Ticker range. ``PriceIndex`` reads only the Parquet footers
+and records, for every row group, its Hive partition and the Ticker min/max
+statistics, so a lookup touches just the row groups that can contain the
+ticker. "Last N days" lookups walk partitions newest first and stop once the
+window is covered. ``PriceStore`` reads row groups through memory-mapped
+files and keeps results for hot tickers in a size-bounded LRU cache. Close it
+(or use it as a context manager) to release the memory-mapped files.
+
+Paths are local (or a mounted/synced copy of the bucket); memory mapping is
+not available for ``gs://`` objects.
+"""
+import bisect
+import datetime as dt
+from collections import OrderedDict, defaultdict
+from pathlib import Path
+from typing import Dict, Hashable, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.parquet as pq
+
+TICKER_COLUMN = "Ticker"
+DATE_COLUMN = "Date"
+
+# Sorts after every real partition, used for files outside a year=/month= layout
+UNPARTITIONED = (9999, 12)
+
+
+class RowGroupRef(NamedTuple):
+    path: Path
+    row_group: int
+    partition: Tuple[int, int]
+    min_ticker: str
+    max_ticker: str
+    num_rows: int
+
+
+def _column_index(schema: pq.ParquetSchema, name: str) -> Optional[int]:
+    for i in range(len(schema)):
+        if schema.column(i).path == name:
+            return i
+    return None
+
+
+def _as_str(value) -> str:
+    return value.decode() if isinstance(value, bytes) else str(value)
+
+
+def _partition_of(path: Path) -> Tuple[int, int]:
+    keys = {}
+    for part in path.parts:
+        name, sep, value = part.partition("=")
+        if sep and name.lower() in ("year", "month"):
+            keys[name.lower()] = int(value)
+    if "year" not in keys:
+        return UNPARTITIONED
+    return keys["year"], keys.get("month", 12)
+
+
+class PriceIndex:
+    """Ticker -> (file, row group) index built from Parquet statistics."""
+
+    def __init__(self, refs: List[RowGroupRef]):
+        self.refs = sorted(refs, key=lambda r: (r.min_ticker, r.max_ticker))
+        self._mins = [r.min_ticker for r in self.refs]
+        # Running maximum of max_ticker lets lookup stop scanning early
+        self._max_upto = []
+        running = ""
+        for ref in self.refs:
+            running = max(running, ref.max_ticker)
+            self._max_upto.append(running)
+
+    @classmethod
+    def build(cls, root: Union[str, Path]) -> "PriceIndex":
+        refs = []
+        for path in sorted(Path(root).rglob("*.parquet")):
+            metadata = pq.read_metadata(path)
+            col = _column_index(metadata.schema, TICKER_COLUMN)
+            if col is None:
+                raise ValueError(f"{path} has no {TICKER_COLUMN} column")
+            partition = _partition_of(path.relative_to(root))
+            for rg in range(metadata.num_row_groups):
+                row_group = metadata.row_group(rg)
+                if row_group.num_rows == 0:
+                    continue
+                stats = row_group.column(col).statistics
+                if stats is None or not stats.has_min_max:
+                    # No statistics: the row group may hold any ticker
+                    low, high = "", "\U0010ffff"
+                else:
+                    low, high = _as_str(stats.min), _as_str(stats.max)
+                refs.append(RowGroupRef(path, rg, partition, low, high, row_group.num_rows))
+        return cls(refs)
+
+    def lookup(self, ticker: str) -> List[RowGroupRef]:
+        # Candidates have min_ticker <= ticker; walk back while max can reach it
+        end = bisect.bisect_right(self._mins, ticker)
+        matches = []
+        for i in range(end - 1, -1, -1):
+            if self._max_upto[i] < ticker:
+                break
+            if self.refs[i].max_ticker >= ticker:
+                matches.append(self.refs[i])
+        matches.reverse()
+        return matches
+
+    def __len__(self) -> int:
+        return len(self.refs)
+
+
+class LRUCache:
+    """Cache of Arrow tables bounded by their total size in bytes."""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries: "OrderedDict[Hashable, pa.Table]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[pa.Table]:
+        table = self._entries.get(key)
+        if table is not None:
+            self._entries.move_to_end(key)
+        return table
+
+    def put(self, key: Hashable, table: pa.Table):
+        if table.nbytes > self.max_bytes:
+            return
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.current_bytes -= old.nbytes
+        self._entries[key] = table
+        self.current_bytes += table.nbytes
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= evicted.nbytes
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._entries
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class PriceStore:
+    """Read API for ticker time series stored under ``transformed/prices/``."""
+
+    def __init__(self, root: Union[str, Path], cache_bytes: int = 256 * 1024 * 1024,
+                 columns: Optional[Sequence[str]] = None):
+        self.root = Path(root)
+        self.index = PriceIndex.build(self.root)
+        self.cache = LRUCache(cache_bytes)
+        self.columns = list(columns) if columns else None
+        if self.columns:
+            for required in (DATE_COLUMN, TICKER_COLUMN):
+                if required not in self.columns:
+                    self.columns.insert(0, required)
+        self._files: Dict[Path, pq.ParquetFile] = {}
+
+    def close(self):
+        for handle in self._files.values():
+            handle.close()
+        self._files.clear()
+
+    def __enter__(self) -> "PriceStore":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def history(self, ticker: str) -> pa.Table:
+        """Full price history for ``ticker``, sorted by Date."""
+        return self.get_many([ticker])[ticker]
+
+    def last_n_days(self, ticker: str, days: int) -> pa.Table:
+        """Rows within ``days`` calendar days of the ticker's latest Date."""
+        return self.get_many([ticker], days=days)[ticker]
+
+    def get_many(self, tickers: Iterable[str], days: Optional[int] = None) -> Dict[str, pa.Table]:
+        """Batch lookup; each uncached row group is read once for all tickers."""
+        tickers = list(dict.fromkeys(tickers))
+        results = {}
+        missing = []
+        for ticker in tickers:
+            full = self.cache.get((ticker, None))
+            if full is not None:
+                results[ticker] = full if days is None else _trim_to_days(full, days)
+                continue
+            window = self.cache.get((ticker, days))
+            if window is not None:
+                results[ticker] = window
+            else:
+                missing.append(ticker)
+
+        for ticker, table in self._load(missing, days).items():
+            self.cache.put((ticker, days), table)
+            results[ticker] = table
+        return {ticker: results[ticker] for ticker in tickers}
+
+    def _open(self, path: Path) -> pq.ParquetFile:
+        handle = self._files.get(path)
+        if handle is None:
+            handle = pq.ParquetFile(path, memory_map=True)
+            self._files[path] = handle
+        return handle
+
+    def _load(self, tickers: List[str], days: Optional[int]) -> Dict[str, pa.Table]:
+        by_partition: Dict[Tuple[int, int], "OrderedDict[RowGroupRef, List[str]]"] = defaultdict(OrderedDict)
+        for ticker in tickers:
+            for ref in self.index.lookup(ticker):
+                by_partition[ref.partition].setdefault(ref, []).append(ticker)
+
+        parts: Dict[str, List[pa.Table]] = {ticker: [] for ticker in tickers}
+        cutoffs: Dict[str, Tuple[int, int]] = {}
+        for partition in sorted(by_partition, reverse=True):
+            for ref, ref_tickers in by_partition[partition].items():
+                # A ticker is done once its window starts after this partition
+                active = [t for t in ref_tickers if t not in cutoffs or partition >= cutoffs[t]]
+                if not active:
+                    continue
+                rows = self._open(ref.path).read_row_group(ref.row_group, columns=self.columns)
+                if len(active) > 1:
+                    rows = rows.filter(pc.is_in(rows[TICKER_COLUMN], pa.array(active)))
+                for ticker in active:
+                    matched = rows.filter(pc.equal(rows[TICKER_COLUMN], ticker))
+                    if matched.num_rows:
+                        parts[ticker].append(matched)
+            if days is None:
+                continue
+            for ticker in tickers:
+                if ticker not in cutoffs and parts[ticker]:
+                    latest = max(pc.max(t[DATE_COLUMN]).as_py() for t in parts[ticker])
+                    cutoff = latest - dt.timedelta(days=days)
+                    cutoffs[ticker] = (cutoff.year, cutoff.month)
+
+        loaded = {}
+        for ticker in tickers:
+            table = self._concat(parts[ticker])
+            loaded[ticker] = table if days is None else _trim_to_days(table, days)
+        return loaded
+
+    def _concat(self, tables: List[pa.Table]) -> pa.Table:
+        if not tables:
+            return self._empty()
+        table = pa.concat_tables(tables, promote_options="default")
+        return table.sort_by(DATE_COLUMN) if DATE_COLUMN in table.column_names else table
+
+    def _empty(self) -> pa.Table:
+        if not self.index.refs:
+            return pa.table({TICKER_COLUMN: pa.array([], pa.string())})
+        schema = self._open(self.index.refs[0].path).schema_arrow
+        if self.columns:
+            schema = pa.schema([schema.field(c) for c in self.columns])
+        return schema.empty_table()
+
+
+def _trim_to_days(table: pa.Table, days: int) -> pa.Table:
+    if table.num_rows == 0 or DATE_COLUMN not in table.column_names:
+        return table
+    dates = table[DATE_COLUMN]
+    latest = pc.max(dates).as_py()
+    if not isinstance(latest, dt.date):
+        raise TypeError(f"Unsupported {DATE_COLUMN} type: {dates.type}")
+    cutoff = latest - dt.timedelta(days=days)
+    # Sorted by Date, so the window is a contiguous tail slice
+    start = int(pc.sum(pc.less_equal(dates, pa.scalar(cutoff, dates.type))).as_py() or 0)
+    return table.slice(start)
@@ -0,0 +1,90 @@
+"""Column contract shared by the Spark transform and the BigQuery load.
+
+The Spark job reads only the RAW_* columns and writes exactly the columns in
+the *_SCHEMA lists, in order and with these types. The load flow builds its
+external table schemas and materialization queries from the same lists.
+
+Kept free of pyspark and google-cloud imports so both stages (and the Spark
+container, which mounts this directory) can import it cheaply.
+"""
+from typing import List, NamedTuple
+
+
+class Column(NamedTuple):
+    name: str
+    type: str  # BigQuery type name
+
+
+# BigQuery type -> Spark SQL type used when casting the transform output
+SPARK_TYPES = {
+    "STRING": "string",
+    "DATE": "date",
+    "FLOAT": "double",
+    "INTEGER": "bigint",
+}
+
+TRANSFORMED_PREFIX = "transformed"
+STATS_DIR = "_stats"
+STATS_PREFIX = f"{TRANSFORMED_PREFIX}/{STATS_DIR}"
+
+RAW_FUNDAMENTALS_COLUMNS = [
+    "Ticker",
+    "Report Date",
+    "Revenue",
+    "Net Income",
+    "Short Term Debt",
+    "Long Term Debt",
+    "Total Current Assets",
+    "Total Current Liabilities",
+    "Total Assets",
+    "Total Equity",
+]
+
+FUNDAMENTALS_SCHEMA = [
+    Column("Ticker", "STRING"),
+    Column("Report_Date", "DATE"),
+    Column("Revenue", "FLOAT"),
+    Column("Net_Income", "FLOAT"),
+    Column("Total_Assets", "FLOAT"),
+    Column("Total_Equity", "FLOAT"),
+    Column("Total_Debt", "FLOAT"),
+    Column("Net_Margin", "FLOAT"),
+    Column("ROE", "FLOAT"),
+    Column("ROA", "FLOAT"),
+    Column("Current_Ratio", "FLOAT"),
+    Column("Debt_to_Equity", "FLOAT"),
+]
+
+FUNDAMENTALS_PARTITIONS = [Column("year", "INTEGER")]
+FUNDAMENTALS_KEY = ["Ticker", "Report_Date"]
+
+RAW_PRICES_COLUMNS = [
+    "Ticker",
+    "Date",
+    "Open",
+    "High",
+    "Low",
+    "Close",
+    "Adj. Close",
+    "Volume",
+]
+
+PRICES_SCHEMA = [
+    Column("Ticker", "STRING"),
+    Column("Date", "DATE"),
+    Column("Open", "FLOAT"),
+    Column("High", "FLOAT"),
+    Column("Low", "FLOAT"),
+    Column("Close", "FLOAT"),
+    Column("Adj_Close", "FLOAT"),
+    Column("Volume", "INTEGER"),
+    Column("SMA_20", "FLOAT"),
+    Column("Daily_Return", "FLOAT"),
+]
+
+PRICES_PARTITIONS = [Column("year", "INTEGER"), Column("month", "INTEGER")]
+PRICES_KEY = ["Ticker", "Date"]
+
+
+def column_names(schema: List[Column]) -> List[str]:
+    return [c.name for c in schema]
@@ -1,46 +1,235 @@
 import sys
+import json
+from datetime import datetime, timezone
+from pyspark import StorageLevel
 from pyspark.sql import SparkSession
 from pyspark.sql import functions as F
 from pyspark.sql.window import Window
+try:
+    from schema_contract import (
+        SPARK_TYPES, TRANSFORMED_PREFIX, STATS_DIR, column_names,
+        RAW_FUNDAMENTALS_COLUMNS, FUNDAMENTALS_SCHEMA, FUNDAMENTALS_PARTITIONS, FUNDAMENTALS_KEY,
+        RAW_PRICES_COLUMNS, PRICES_SCHEMA, PRICES_PARTITIONS, PRICES_KEY,
+    )
+except ImportError:
+    # Imported in-process from the project root (local runner) rather than spark-submit
+    from spark.schema_contract import (
+        SPARK_TYPES, TRANSFORMED_PREFIX, STATS_DIR, column_names,
+        RAW_FUNDAMENTALS_COLUMNS, FUNDAMENTALS_SCHEMA, FUNDAMENTALS_PARTITIONS, FUNDAMENTALS_KEY,
+        RAW_PRICES_COLUMNS, PRICES_SCHEMA, PRICES_PARTITIONS, PRICES_KEY,
+    )
 
-def main(project_id, credentials_path, bucket_name, mode):
-    spark = SparkSession.builder \
-        .appName(f"Stock-ETL-{mode}") \
-        .config("spark.hadoop.fs.gs.impl", "com.google.cloud.hadoop.fs.gcs.GoogleHadoopFileSystem") \
-        .config("spark.hadoop.google.cloud.auth.service.account.enable", "true") \
-        .config("spark.hadoop.google.cloud.auth.service.account.json.keyfile", credentials_path) \
-        .getOrCreate()
-
-    if mode == "fundamentals":
-        df = spark.read.parquet(f"gs://{bucket_name}/raw/fundamentals/*.parquet")
-        
-        df_clean = df.withColumn(
-            "calculated_total_debt", 
-            F.coalesce(F.col("Short Term Debt"), F.lit(0)) + F.coalesce(F.col("Long Term Debt"), F.lit(0))
-        ).withColumn(
-            "net_margin", F.col("Net Income") / F.col("Revenue")
-        ).withColumn(
-            "current_ratio", F.col("Total Current Assets") / F.col("Total Current Liabilities")
-        ).withColumn(
-            "debt_to_equity", F.col("calculated_total_debt") / F.col("Total Equity")
-        ).withColumnRenamed("calculated_total_debt", "Total Debt")
-        
-        df_clean.withColumn("year", F.year("Report Date")) \
-                .write.mode("overwrite").partitionBy("year") \
-                .parquet(f"gs://{bucket_name}/transformed/fundamentals/")
-
-    elif mode == "prices":
-        prices = spark.read.parquet(f"gs://{bucket_name}/raw/prices/*.parquet")
-        
-        window_spec = Window.partitionBy("Ticker").orderBy("Date")
-        df_clean = prices.withColumn("sma_20", F.avg("Close").over(window_spec.rowsBetween(-19, 0))) \
-                         .withColumn("daily_return", (F.col("Close") / F.lag("Close", 1).over(window_spec)) - 1)
-        
-        df_clean.withColumn("year", F.year("Date")).withColumn("month", F.month("Date")) \
-                .write.mode("overwrite").partitionBy("year", "month") \
-                .parquet(f"gs://{bucket_name}/transformed/prices/")
-
-    spark.stop()
+NON_ORDERABLE_TYPES = ("array", "map", "struct", "binary")
+
+PRICE_WINDOW_ROWS = 20
+# Row group size for price output. With files sorted by Ticker, small row
+# groups give narrow Ticker min/max statistics that readers can prune on.
+PRICE_ROW_GROUP_BYTES = 1024 * 1024
+
+def read_projected(spark, path, columns):
+    return spark.read.parquet(path).select(*[F.col(f"`{c}`") for c in columns])
+
+def conform(df, schema, expressions):
+    """Select the contract's output columns, in order and cast to their types.
+
+    ``expressions`` maps output names to derived columns; any other contract
+    column is taken from the input column of the same name.
+    """
+    return df.select(*[
+        expressions.get(c.name, F.col(f"`{c.name}`")).cast(SPARK_TYPES[c.type]).alias(c.name)
+        for c in schema
+    ])
+
+def compute_partition_stats(df, partition_cols, key_cols, close_col=None):
+    """Per-partition quality statistics, plus a grand total, from one aggregation.
+
+    rollup() yields one row per partition and a grand-total row in the same
+    job; grouping_id() separates them from intermediate levels (e.g. year-only
+    rows when partitioned by year and month).
+    """
+    columns = [c for c in df.columns if c not in partition_cols]
+    orderable = [c for c, t in df.dtypes if c in columns and not t.startswith(NON_ORDERABLE_TYPES)]
+
+    aggs = [F.count(F.lit(1)).alias("row_count"),
+            F.approx_count_distinct("Ticker").alias("approx_distinct_tickers"),
+            F.grouping_id().alias("_grouping")]
+    aggs += [F.sum(F.col(c).isNull().cast("long")).alias(f"nulls_{i}") for i, c in enumerate(columns)]
+    aggs += [F.min(c).alias(f"min_{i}") for i, c in enumerate(orderable)]
+    aggs += [F.max(c).alias(f"max_{i}") for i, c in enumerate(orderable)]
+    if close_col:
+        aggs.append(F.sum((F.col(close_col) <= 0).cast("long")).alias("non_positive_close"))
+    total_grouping = (1 << len(partition_cols)) - 1
+    rows = df.rollup(*partition_cols).agg(*aggs) \
+             .filter(F.col("_grouping").isin(0, total_grouping)).collect()
+
+    duplicates = df.groupBy(*partition_cols, *key_cols).count().filter(F.col("count") > 1) \
+                   .groupBy(*partition_cols).agg(F.sum(F.col("count") - 1).alias("duplicate_keys")) \
+                   .collect()
+    dup_by_partition = {tuple(r[c] for c in partition_cols): r["duplicate_keys"] for r in duplicates}
+
+    def to_entry(row, partition=None):
+        entry = {
+            "row_count": row["row_count"],
+            "approx_distinct_tickers": row["approx_distinct_tickers"],
+            "null_counts": {c: row[f"nulls_{i}"] for i, c in enumerate(columns)},
+            "min": {c: row[f"min_{i}"] for i, c in enumerate(orderable)},
+            "max": {c: row[f"max_{i}"] for i, c in enumerate(orderable)},
+        }
+        if partition is None:
+            entry["duplicate_keys"] = sum(dup_by_partition.values())
+        else:
+            entry["partition"] = dict(zip(partition_cols, partition))
+            entry["duplicate_keys"] = dup_by_partition.get(partition, 0)
+        if close_col:
+            entry["non_positive_close"] = row["non_positive_close"] or 0
+        return entry
+
+    partitions = [to_entry(r, tuple(r[c] for c in partition_cols)) for r in rows if r["_grouping"] == 0]
+    totals = [to_entry(r) for r in rows if r["_grouping"] == total_grouping]
+    # An empty input produces no grand-total row
+    total = totals[0] if totals else {"row_count": 0, "approx_distinct_tickers": 0, "duplicate_keys": 0,
+                                      "null_counts": {}, "min": {}, "max": {}}
+    if close_col:
+        total.setdefault("non_positive_close", 0)
+    return {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "partition_columns": list(partition_cols),
+        "key_columns": list(key_cols),
+        "total": total,
+        "partitions": partitions,
+    }
+
+def write_stats(spark, path, stats):
+    # Single small JSON document, written through the Hadoop FS so gs:// works
+    jvm = spark._jvm
+    hadoop_path = jvm.org.apache.hadoop.fs.Path(path)
+    fs = hadoop_path.getFileSystem(spark._jsc.hadoopConfiguration())
+    out = fs.create(hadoop_path, True)
+    try:
+        out.write(bytearray(json.dumps(stats, default=str, indent=2).encode("utf-8")))
+    finally:
+        out.close()
+    print(f"Wrote transform statistics to {path}")
+
+def storage_root(bucket_name):
+    """gs://<bucket> for a bare bucket name (the docker/config path); URIs are used as given.
+
+    Local runs must pass an explicit file:// URI, so a relative directory is
+    never mistaken for a bucket name.
+    """
+    if "://" in bucket_name:
+        return bucket_name.rstrip("/")
+    if "/" in bucket_name or "\\" in bucket_name:
+        raise ValueError(f"{bucket_name!r} is neither a bucket name nor a URI; "
+                         "pass local directories as file:// URIs")
+    return f"gs://{bucket_name}"
+
+def build_session(mode, credentials_path, root, master=None, conf=None):
+    builder = SparkSession.builder.appName(f"Stock-ETL-{mode}")
+    if master:
+        builder = builder.master(master)
+    if root.startswith("gs://"):
+        builder = builder \
+            .config("spark.hadoop.fs.gs.impl", "com.google.cloud.hadoop.fs.gcs.GoogleHadoopFileSystem") \
+            .config("spark.hadoop.google.cloud.auth.service.account.enable", "true") \
+            .config("spark.hadoop.google.cloud.auth.service.account.json.keyfile", credentials_path)
+    for key, value in (conf or {}).items():
+        builder = builder.config(key, value)
+    return builder.getOrCreate()
+
+def main(project_id, credentials_path, bucket_name, mode,
+         start_date=None, end_date=None, output_prefix=TRANSFORMED_PREFIX,
+         master=None, conf=None):
+    """Transform one dataset, optionally limited to [start_date, end_date).
+
+    ``bucket_name`` may also be a file:// URI of a local directory holding
+    the same raw/ and transformed/ layout. A date range and output prefix are
+    used by backfills to rebuild a slice of history into a staging location.
+    ``master`` and ``conf`` let the local runner call this in-process.
+    """
+    root = storage_root(bucket_name)
+    spark = build_session(mode, credentials_path, root, master, conf)
+
+    df_out = None
+    # In-process runs share the worker with later tasks and retries, so a
+    # failed job must not leave its session or cached output behind
+    try:
+        if mode == "fundamentals":
+            # Selecting the contract's raw columns lets Parquet skip the rest
+            df = read_projected(spark, f"{root}/raw/fundamentals/*.parquet", RAW_FUNDAMENTALS_COLUMNS)
+            if start_date:
+                df = df.filter((F.col("`Report Date`") >= F.to_date(F.lit(start_date))) &
+                               (F.col("`Report Date`") < F.to_date(F.lit(end_date))))
+
+            total_debt = F.coalesce(F.col("Short Term Debt"), F.lit(0)) + F.coalesce(F.col("Long Term Debt"), F.lit(0))
+            df_clean = conform(df, FUNDAMENTALS_SCHEMA, {
+                "Report_Date": F.to_date("Report Date"),
+                "Net_Income": F.col("Net Income"),
+                "Total_Assets": F.col("Total Assets"),
+                "Total_Equity": F.col("Total Equity"),
+                "Total_Debt": total_debt,
+                "Net_Margin": F.col("Net Income") / F.col("Revenue"),
+                "ROE": F.col("Net Income") / F.col("Total Equity"),
+                "ROA": F.col("Net Income") / F.col("Total Assets"),
+                "Current_Ratio": F.col("Total Current Assets") / F.col("Total Current Liabilities"),
+                "Debt_to_Equity": total_debt / F.col("Total Equity"),
+            })
+
+            df_out = df_clean.withColumn("year", F.year("Report_Date")) \
+                             .persist(StorageLevel.MEMORY_AND_DISK)
+            df_out.write.mode("overwrite").partitionBy(*column_names(FUNDAMENTALS_PARTITIONS)) \
+                  .parquet(f"{root}/{output_prefix}/fundamentals/")
+            # Computed from the persisted output rather than rescanning GCS
+            stats = compute_partition_stats(df_out, column_names(FUNDAMENTALS_PARTITIONS), FUNDAMENTALS_KEY)
+            stats["mode"] = mode
+            write_stats(spark, f"{root}/{output_prefix}/{STATS_DIR}/fundamentals.json", stats)
+
+        elif mode == "prices":
+            prices = read_projected(spark, f"{root}/raw/prices/*.parquet", RAW_PRICES_COLUMNS)
+            if start_date:
+                start = F.to_date(F.lit(start_date))
+                in_range = prices.filter((F.col("Date") >= start) & (F.col("Date") < F.to_date(F.lit(end_date))))
+                # Each ticker's last PRICE_WINDOW_ROWS - 1 rows before the range,
+                # however far back a data gap puts them, so windows at the start
+                # of the range match a full rebuild
+                lead_in = prices.filter(F.col("Date") < start) \
+                    .withColumn("_row", F.row_number().over(
+                        Window.partitionBy("Ticker").orderBy(F.col("Date").desc()))) \
+                    .filter(F.col("_row") < PRICE_WINDOW_ROWS) \
+                    .drop("_row")
+                prices = lead_in.unionByName(in_range)
+
+            window_spec = Window.partitionBy("Ticker").orderBy("Date")
+            df_clean = conform(prices, PRICES_SCHEMA, {
+                "Date": F.to_date("Date"),
+                "Adj_Close": F.col("`Adj. Close`"),
+                "SMA_20": F.avg("Close").over(window_spec.rowsBetween(-(PRICE_WINDOW_ROWS - 1), 0)),
+                "Daily_Return": (F.col("Close") / F.lag("Close", 1).over(window_spec)) - 1,
+            })
+
+            if start_date:
+                df_clean = df_clean.filter(F.col("Date") >= F.to_date(F.lit(start_date)))
+
+            # One file per month, sorted by Ticker and Date, so each row group
+            # holds a narrow range of tickers instead of a hash-spread subset.
+            # Leading with the partition columns satisfies the partitioned
+            # writer's required ordering, so it does not add a sort of its own.
+            partition_cols = column_names(PRICES_PARTITIONS)
+            df_out = df_clean.withColumn("year", F.year("Date")).withColumn("month", F.month("Date")) \
+                             .repartition(*partition_cols) \
+                             .sortWithinPartitions(*partition_cols, "Ticker", "Date") \
+                             .persist(StorageLevel.MEMORY_AND_DISK)
+            df_out.write.mode("overwrite").partitionBy(*partition_cols) \
+                  .option("parquet.block.size", PRICE_ROW_GROUP_BYTES) \
+                  .parquet(f"{root}/{output_prefix}/prices/")
+            stats = compute_partition_stats(df_out, partition_cols, PRICES_KEY, close_col="Close")
+            stats["mode"] = mode
+            write_stats(spark, f"{root}/{output_prefix}/{STATS_DIR}/prices.json", stats)
+    finally:
+        if df_out is not None:
+            df_out.unpersist()
+        spark.stop()
 
 if __name__ == "__main__":
-    main(sys.argv[1], sys.argv[2], sys.argv[3], sys.argv[4])
\ No newline at end of file
+    # Optional trailing arguments: start_date end_date [output_prefix]
+    main(*sys.argv[1:])
\ No newline at end of file
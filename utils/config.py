@@ -1,31 +1,35 @@
 import os
+from functools import lru_cache
 from pathlib import Path
-from typing import Dict
-from dotenv import load_dotenv
+from typing import Dict, Optional
+from urllib.parse import urlparse
+from urllib.request import url2pathname
 
-load_dotenv('.pyenv')
+PROJECT_ROOT = Path(__file__).parent.parent
 
+@lru_cache(maxsize=None)
 def load_config() -> Dict[str, str]:
     config = {}
-    pyenv_path = Path(__file__).parent.parent / '.pyenv'
-    
+    pyenv_path = PROJECT_ROOT / '.pyenv'
+
     if not pyenv_path.exists():
         raise FileNotFoundError(
             f".pyenv file not found at {pyenv_path}. "
             "Please create it based on .pyenv.example"
         )
-    
+
     with open(pyenv_path, 'r') as f:
         for line in f:
             line = line.strip()
             if line and not line.startswith('#'):
                 key, value = line.split('=', 1)
                 config[key] = value
-    
+
     return config
 
+@lru_cache(maxsize=None)
 def get_credentials_path() -> Path:
-    creds_path = Path(__file__).parent.parent / 'gcp_credentials.json'
+    creds_path = PROJECT_ROOT / 'gcp_credentials.json'
     if not creds_path.exists():
         raise FileNotFoundError(
             f"GCP credentials not found at {creds_path}. "
@@ -33,13 +37,55 @@ def get_credentials_path() -> Path:
         )
     return creds_path
 
-class Config:
-    SIMFIN_API_KEY = os.getenv('sim-fin-api-key')
-    GCP_PROJECT_ID = os.getenv('project-name')
-    GCS_BUCKET = os.getenv('bucket-name')
-    GCP_REGION = os.getenv('region')
-    DATASET_NAME = os.getenv('dataset-name')
+def get_data_root(data_root: Optional[str] = None) -> Path:
+    """Absolute local directory holding raw/ and transformed/ for co-located runs."""
+    if not data_root:
+        return (Path.cwd() / 'data_lake').resolve()
+    if '://' in data_root and not data_root.startswith('file://'):
+        # Co-located extract writes through the local filesystem, so a
+        # gs:// root would become a directory named "gs:"
+        raise ValueError(f"Co-located runs need a local data root, got {data_root!r}")
+    if data_root.startswith('file://'):
+        return Path(url2pathname(urlparse(data_root).path)).resolve()
+    return Path(data_root).resolve()
+
+def get_setting(key: str) -> Optional[str]:
+    # Environment variables take precedence over .pyenv, as with load_dotenv
+    value = os.getenv(key)
+    if value is not None:
+        return value
+    return load_config().get(key)
+
+class _LazyConfig:
     GCP_CREDENTIALS_PATH = 'gcp_credentials.json'
 
-CONFIG = load_config()
-CREDENTIALS_PATH = get_credentials_path()
\ No newline at end of file
+    @property
+    def SIMFIN_API_KEY(self) -> Optional[str]:
+        return get_setting('sim-fin-api-key')
+
+    @property
+    def GCP_PROJECT_ID(self) -> Optional[str]:
+        return get_setting('project-name')
+
+    @property
+    def GCS_BUCKET(self) -> Optional[str]:
+        return get_setting('bucket-name')
+
+    @property
+    def GCP_REGION(self) -> Optional[str]:
+        return get_setting('region')
+
+    @property
+    def DATASET_NAME(self) -> Optional[str]:
+        return get_setting('dataset-name')
+
+Config = _LazyConfig()
+
+def __getattr__(name: str):
+    # CONFIG and CREDENTIALS_PATH are resolved on first access (and cached),
+    # so importing a flow no longer requires .pyenv or credentials on disk.
+    if name == 'CONFIG':
+        return load_config()
+    if name == 'CREDENTIALS_PATH':
+        return get_credentials_path()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,104 @@
+"""Lock object serializing writers and the load over transformed/ in the bucket.
+
+GCS has no directory rename, so replacing partitions (a docker transform, a
+backfill swap or a co-located upload) rewrites objects one at a time and a
+reader can see a mix of old and new files while it runs. Every writer of
+transformed/ holds this lock for its whole rewrite, and the load flow holds
+it from registering the external tables until the materialized tables are
+validated, so a load never reads a half-finished rewrite. Ad hoc queries on
+the external tables and local PriceStore copies do not take the lock; query
+the materialized tables instead.
+
+The lock is created with a generation precondition, so only one holder can
+take it. Each run gets its own owner id. If a writer fails while holding the
+lock, the lock stays in place (keeping loads out of the half-written tree)
+and the owner id is kept under lock_state/, so the next run of the same kind
+on this machine resumes and finishes the rewrite. Anything else waiting on a
+stale lock needs the object deleted by hand after checking.
+"""
+import json
+import os
+import socket
+import uuid
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
+
+LOCK_PATH = "locks/transformed.lock"
+LOCK_STATE_DIR = Path.cwd() / "lock_state"
+
+def new_owner(kind: str) -> str:
+    return f"{kind} {socket.gethostname()}:{os.getpid()} {uuid.uuid4().hex[:8]}"
+
+def claim_owner(kind: str) -> str:
+    """Owner id left by a failed run of ``kind`` on this machine, or a new one.
+
+    Reading and removing the file claims it, so two runs started at once
+    cannot both resume the same failed run.
+    """
+    path = LOCK_STATE_DIR / f"{kind}.owner"
+    try:
+        owner = path.read_text().strip()
+        path.unlink()
+        return owner
+    except FileNotFoundError:
+        return new_owner(kind)
+
+def remember_owner(kind: str, owner: str):
+    LOCK_STATE_DIR.mkdir(exist_ok=True)
+    (LOCK_STATE_DIR / f"{kind}.owner").write_text(owner)
+
+def lock_holder(bucket) -> dict:
+    """Lock contents, or an empty dict when transformed/ is not locked."""
+    from google.api_core.exceptions import NotFound
+    try:
+        return json.loads(bucket.blob(LOCK_PATH).download_as_bytes())
+    except NotFound:
+        return {}
+
+def acquire(bucket, owner: str):
+    from google.api_core.exceptions import PreconditionFailed
+    body = json.dumps({"owner": owner, "acquired_at": datetime.now(timezone.utc).isoformat()})
+    try:
+        bucket.blob(LOCK_PATH).upload_from_string(body, content_type="application/json",
+                                                  if_generation_match=0)
+    except PreconditionFailed:
+        holder = lock_holder(bucket)
+        # Only the run that left the lock behind may resume under it
+        if holder.get("owner") != owner:
+            raise RuntimeError(f"gs://{bucket.name}/{LOCK_PATH} is held by {holder.get('owner')} "
+                               f"since {holder.get('acquired_at')}")
+    print(f"✓ Locked {LOCK_PATH} for {owner}")
+
+def release(bucket, owner: str):
+    from google.api_core.exceptions import NotFound
+    if lock_holder(bucket).get("owner") != owner:
+        raise RuntimeError(f"gs://{bucket.name}/{LOCK_PATH} is not held by {owner}")
+    try:
+        bucket.blob(LOCK_PATH).delete()
+    except NotFound:
+        pass
+    print(f"✓ Released {LOCK_PATH}")
+
+@contextmanager
+def transformed_lock(bucket, kind: str, owner: Optional[str] = None, keep_on_error: bool = True):
+    """Hold the lock for the duration of the block.
+
+    Without an explicit ``owner`` (a backfill keeps its own in its state
+    file) the run resumes a failed ``kind`` run left on this machine or
+    takes a new id. Writers keep the lock when the block fails; readers
+    pass keep_on_error=False, as they leave nothing half-written.
+    """
+    remembered = owner is None
+    owner = owner or claim_owner(kind)
+    acquire(bucket, owner)
+    try:
+        yield owner
+    except BaseException:
+        if not keep_on_error:
+            release(bucket, owner)
+        elif remembered:
+            remember_owner(kind, owner)
+        raise
+    release(bucket, owner)